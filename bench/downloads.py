@@ -0,0 +1,50 @@
+import argparse
+import os
+import tempfile
+import time
+
+from bench.fixture_server import delayed_handler, make_fixtures, serve_directory
+from downloader import Media, MediaStream
+from http_pool import ConnectionPool
+
+
+# Measures download throughput against a local fixture server at several concurrency levels,
+# through the same MediaStream queue, staging and renaming that scrape() uses.
+#
+# Usage: python -m bench.downloads --files 200 --size 262144 --workers 1 4 8 16
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the download stage against a local HTTP server')
+    parser.add_argument('--files', type=int, default=200, help='number of fixture files to serve')
+    parser.add_argument('--size', type=int, default=256 * 1024, help='size of each fixture file, in bytes')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8, 16],
+                        help='concurrency levels to measure')
+    parser.add_argument('--delay', type=float, default=0.0,
+                        help='artificial per-request latency, in seconds, to imitate a remote CDN')
+    arguments = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as fixtures, tempfile.TemporaryDirectory() as output:
+        names = make_fixtures(fixtures, arguments.files, arguments.size)
+        server, base_url = serve_directory(fixtures, delayed_handler(arguments.delay))
+        urls = [f"{base_url}/{name}" for name in names]
+        print(f"{'workers':>8} {'seconds':>9} {'files/s':>9} {'MiB/s':>9}")
+        try:
+            for workers in arguments.workers:
+                pool = ConnectionPool()
+                stream = MediaStream({'file': (output, 'bench', '.bin')}, workers, pool=pool, quiet=True)
+                start = time.perf_counter()
+                for name, url in zip(names, urls):
+                    stream.put(Media('file', url, None, 0, name))
+                stream.close()
+                saved = stream.finish({'file': len(urls)})
+                elapsed = time.perf_counter() - start
+                pool.close()
+                print(f"{workers:>8} {elapsed:>9.3f} {len(saved) / elapsed:>9.1f} "
+                      f"{stream.downloaded / elapsed / 2 ** 20:>9.1f}")
+                for _, file_name in saved:
+                    os.remove(file_name)
+        finally:
+            server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
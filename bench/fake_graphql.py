@@ -0,0 +1,158 @@
+import json
+import threading
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+TYPENAMES = ('GraphImage', 'GraphVideo', 'GraphSidecar')
+
+
+# Builds `count` synthetic timeline nodes, newest first, cycling through images, videos and sidecars.
+# Media URLs point at media_base_url/<id>.jpg or .mp4. Media IDs count up from first_id.
+def make_timeline(count, media_base_url="http://127.0.0.1/media", newest=1600000000, first_id=1000000):
+    nodes = []
+    for index in range(count):
+        media_id = str(first_id + index)
+        node = {
+            'id'                : media_id,
+            'shortcode'         : f"T{media_id}",
+            '__typename'        : TYPENAMES[index % len(TYPENAMES)],
+            'taken_at_timestamp': newest - index * 60,
+            'display_url'       : f"{media_base_url}/{media_id}.jpg",
+        }
+        if node['__typename'] == 'GraphVideo':
+            node['video_url'] = f"{media_base_url}/{media_id}.mp4"
+        elif node['__typename'] == 'GraphSidecar':
+            children = []
+            for child in range(2):
+                child_id = f"{media_id}{child}"
+                children.append({'node': {
+                    'id'         : child_id,
+                    '__typename' : 'GraphImage' if child == 0 else 'GraphVideo',
+                    'display_url': f"{media_base_url}/{child_id}.jpg",
+                    'video_url'  : f"{media_base_url}/{child_id}.mp4",
+                }})
+            node['edge_sidecar_to_children'] = {'edges': children}
+        nodes.append(node)
+    return nodes
+
+
+# Builds `count` synthetic IGTV nodes, newest first. Like Instagram's, they carry no video URL.
+def make_igtv(count, newest=1600000000, first_id=2000000):
+    nodes = []
+    for index in range(count):
+        media_id = str(first_id + index)
+        nodes.append({
+            'id'                : media_id,
+            'shortcode'         : f"V{media_id}",
+            '__typename'        : 'GraphVideo',
+            'product_type'      : 'igtv',
+            'taken_at_timestamp': newest - index * 60,
+        })
+    return nodes
+
+
+# Slices nodes into a GraphQL connection ("edge_...") starting at offset, with a cursor to the next slice
+def make_page(nodes, offset, size):
+    edges = [{'node': node} for node in nodes[offset:offset + size]]
+    has_next = offset + size < len(nodes)
+    return {
+        'count'    : len(nodes),
+        'page_info': {'has_next_page': has_next, 'end_cursor': str(offset + size) if has_next else None},
+        'edges'    : edges
+    }
+
+
+# A synthetic profile whose first 12 posts are served from '/<name>/?__a=1' and the rest from '/graphql/query/'
+class FakeProfile:
+    def __init__(self, name, timeline_count, igtv_count=0, user_id='4242', media_base_url="http://127.0.0.1/media"):
+        self.name = name
+        self.user_id = user_id
+        self.timeline = make_timeline(timeline_count, media_base_url)
+        self.igtv = make_igtv(igtv_count)
+        self.media_base_url = media_base_url
+
+    # Adds new posts on top of the profile, as if they were published after every existing one
+    def publish(self, timeline_count, igtv_count=0):
+        newest = max((node['taken_at_timestamp'] for node in self.timeline + self.igtv), default=1600000000)
+        newest += 60 * (max(timeline_count, igtv_count) + 1)
+        first_id = max((int(node['id']) for node in self.timeline), default=999999) + 1
+        self.timeline = make_timeline(timeline_count, self.media_base_url, newest, first_id) + self.timeline
+        first_id = max((int(node['id']) for node in self.igtv), default=1999999) + 1
+        self.igtv = make_igtv(igtv_count, newest, first_id) + self.igtv
+
+    def metadata(self):
+        return {'graphql': {'user': {
+            'id'                          : self.user_id,
+            'username'                    : self.name,
+            'edge_owner_to_timeline_media': make_page(self.timeline, 0, 12),
+            'edge_felix_video_timeline'   : make_page(self.igtv, 0, 12),
+        }}}
+
+    # Answers a GraphQL query the way Instagram does. Any hash other than the IGTV one pages the timeline.
+    def query(self, query_hash, variables, igtv_hash='bc78b344a68ed16dd5d7f264681c4c76'):
+        offset = int(variables.get('after') or 0)
+        size = int(variables.get('first', 12))
+        if query_hash == igtv_hash:
+            user = {'edge_felix_video_timeline': make_page(self.igtv, offset, size)}
+        else:
+            user = {'edge_owner_to_timeline_media': make_page(self.timeline, offset, size)}
+        user['id'] = self.user_id
+        return {'data': {'user': user}, 'status': 'ok'}
+
+    # JSON body for a request URL, or None if the URL is not one this profile answers
+    def respond(self, url):
+        parts = urllib.parse.urlsplit(url)
+        query = urllib.parse.parse_qs(parts.query)
+        if parts.path == '/graphql/query/':
+            return self.query(query['query_hash'][0], json.loads(query['variables'][0]))
+        if query.get('__a') != ['1']:
+            return None
+        if parts.path.strip('/') == self.name:
+            return self.metadata()
+        if parts.path.startswith('/tv/'):
+            return self.post(parts.path.strip('/').split('/')[-1])
+        return None
+
+    # JSON of a single IGTV post, as served by '/tv/<shortcode>/?__a=1'
+    def post(self, shortcode):
+        for node in self.igtv:
+            if node['shortcode'] == shortcode:
+                return {'graphql': {'shortcode_media': {
+                    'id'       : node['id'],
+                    'shortcode': shortcode,
+                    'video_url': f"{self.media_base_url}/{node['id']}.mp4"
+                }}}
+        return None
+
+
+class FakeGraphQLHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    profile = None
+
+    def do_GET(self):
+        body = self.profile.respond(self.path)
+        if body is None:
+            self.send_error(404)
+            return
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+# Serves profile on a free local port in a background thread
+#
+# returns:  the server (call shutdown() when done) and its base URL
+def serve_profile(profile):
+    handler = type('Handler', (FakeGraphQLHandler,), {'profile': profile})
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address
+    return server, f"http://{host}:{port}"
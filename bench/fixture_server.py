@@ -0,0 +1,97 @@
+import os
+import re
+import threading
+import time
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+
+# Serves fixture files over keep-alive HTTP/1.1 without logging every request to stderr.
+# Single "bytes=<start>-" Range requests are answered with 206, or 416 past the end, like the Instagram CDN does.
+class QuietHandler(SimpleHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def send_head(self):
+        match = re.fullmatch(r'bytes=(\d+)-', self.headers.get('Range', ''))
+        path = self.translate_path(self.path)
+        if match is None or not os.path.isfile(path):
+            return super().send_head()
+        start = int(match.group(1))
+        size = os.path.getsize(path)
+        if start >= size:
+            self.send_response(416)
+            self.send_header('Content-Range', f"bytes */{size}")
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return None
+        file = open(path, 'rb')
+        file.seek(start)
+        self.send_response(206)
+        self.send_header('Content-Type', self.guess_type(path))
+        self.send_header('Content-Range', f"bytes {start}-{size - 1}/{size}")
+        self.send_header('Content-Length', str(size - start))
+        self.end_headers()
+        return file
+
+    def log_message(self, format, *args):
+        pass
+
+
+# The default listen backlog of 5 makes connections past the fifth simultaneous one wait a second
+# for a SYN retry, which shows up as a fake stall at higher worker counts
+class FixtureServer(ThreadingHTTPServer):
+    request_queue_size = 128
+
+
+# Builds a handler class that waits `delay` seconds before answering, to imitate a distant server
+def delayed_handler(delay):
+    if not delay:
+        return QuietHandler
+
+    class DelayedHandler(QuietHandler):
+        def do_GET(self):
+            time.sleep(delay)
+            super().do_GET()
+
+    return DelayedHandler
+
+
+# Builds a handler class that answers every GET with `size` bytes, so a replayed profile's media
+# can be downloaded without creating a file per post
+def synthetic_media_handler(size):
+    block = os.urandom(size)
+
+    class SyntheticMediaHandler(QuietHandler):
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/octet-stream')
+            self.send_header('Content-Length', str(size))
+            self.end_headers()
+            self.wfile.write(block)
+
+    return SyntheticMediaHandler
+
+
+# Writes `count` files of `size` random bytes into directory, named 0.bin, 1.bin, ...
+#
+# returns:  list of the file names written
+def make_fixtures(directory, count, size):
+    names = []
+    for index in range(count):
+        name = f"{index}.bin"
+        with open(os.path.join(directory, name), 'wb') as file:
+            file.write(os.urandom(size))
+        names.append(name)
+    return names
+
+
+# Starts a local HTTP server for directory on a free port in a background thread
+#
+# returns:  the server (call shutdown() when done) and its base URL
+def serve_directory(directory, handler=QuietHandler):
+    server = FixtureServer(('127.0.0.1', 0), partial(handler, directory=directory))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address
+    return server, f"http://{host}:{port}"
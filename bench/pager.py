@@ -0,0 +1,43 @@
+import argparse
+import time
+
+from bench.fake_graphql import FakeProfile, serve_profile
+from pager import GraphQLPager, HttpTransport, Pacer
+
+TIMELINE_HASH = '32b14723a678bd4628d70c1f877b94c9'
+
+
+# Measures how fast the pager walks a synthetic timeline served by a local fake GraphQL server.
+#
+# Usage: python -m bench.pager --posts 5000 --page-size 12 30 50
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark GraphQL pagination against a local fake server')
+    parser.add_argument('--posts', type=int, default=5000, help='number of posts on the synthetic timeline')
+    parser.add_argument('--page-size', type=int, nargs='+', default=[12, 30, 50], help='page sizes to measure')
+    parser.add_argument('--interval', type=float, default=0.0, help='pacing interval between pages, in seconds')
+    arguments = parser.parse_args()
+
+    profile = FakeProfile('bench', arguments.posts)
+    server, base_url = serve_profile(profile)
+    print(f"{'page size':>9} {'pages':>7} {'seconds':>9} {'pages/s':>9} {'posts/s':>9}")
+    try:
+        for page_size in arguments.page_size:
+            pager = GraphQLPager(HttpTransport(origin=base_url), page_size, Pacer(arguments.interval))
+            start = time.perf_counter()
+            user = pager.get_json(f"https://www.instagram.com/{profile.name}/?__a=1")['graphql']['user']
+            pages, posts = 1, 0
+            while True:
+                timeline = user['edge_owner_to_timeline_media']
+                posts += len(timeline['edges'])
+                if not timeline['page_info']['has_next_page']:
+                    break
+                user = pager.next_page(profile.user_id, timeline['page_info']['end_cursor'], TIMELINE_HASH)
+                pages += 1
+            elapsed = time.perf_counter() - start
+            print(f"{page_size:>9} {pages:>7} {elapsed:>9.3f} {pages / elapsed:>9.1f} {posts / elapsed:>9.1f}")
+    finally:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,200 @@
+import argparse
+import copy
+import importlib.machinery
+import importlib.util
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+
+from bench.fake_graphql import FakeProfile
+from bench.fixture_server import serve_directory, synthetic_media_handler
+from pager import PAGE_SIZE, GraphQLPager, Pacer, Response, build_request
+from replay import ReplayTransport, fixture_name
+from resolver import ShortcodeCache, ShortcodeResolver
+from state import StateStore
+
+# CDN origin the synthetic fixtures point at. ReplayTransport rewrites it to the local media server.
+FAKE_CDN = "https://scontent.cdninstagram.com/v"
+
+
+# Imports thirstbot9000.PY, whose upper-case extension keeps it out of reach of a plain import
+def load_thirstbot():
+    path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'thirstbot9000.PY')
+    loader = importlib.machinery.SourceFileLoader('thirstbot9000', path)
+    module = importlib.util.module_from_spec(importlib.util.spec_from_loader(loader.name, loader))
+    loader.exec_module(module)
+    return module
+
+
+# Writes every response a scrape of profile would see, under the names ReplayTransport looks for.
+# Stands in for a session recorded with --record, at any size.
+#
+# returns:  dict of the recorded URLs: 'profile', and lists of 'timeline' pages, 'igtv' pages and 'posts'
+def write_profile_fixtures(tb, profile, directory, page_size=PAGE_SIZE):
+    def write(url, body):
+        with open(os.path.join(directory, fixture_name(url)), 'w') as file:
+            json.dump(body, file)
+        return url
+
+    urls = {'profile': write(f"https://www.instagram.com/{profile.name}/?__a=1", profile.metadata())}
+    metadata = profile.metadata()['graphql']['user']
+    for kind, edge, query_hash in (('timeline', 'edge_owner_to_timeline_media', tb.TIMELINE_HASH),
+                                   ('igtv', 'edge_felix_video_timeline', tb.IGTV_HASH)):
+        urls[kind] = []
+        page_info = metadata[edge]['page_info']
+        while page_info['has_next_page']:
+            url = build_request(profile.user_id, page_info['end_cursor'], query_hash, page_size)
+            variables = {'id': profile.user_id, 'first': page_size, 'after': page_info['end_cursor']}
+            body = profile.query(query_hash, variables, tb.IGTV_HASH)
+            urls[kind].append(write(url, body))
+            page_info = body['data']['user'][edge]['page_info']
+    urls['posts'] = [write(f"https://www.instagram.com/tv/{node['shortcode']}/?__a=1", profile.post(node['shortcode']))
+                     for node in profile.igtv]
+    return urls
+
+
+# Replays a synthetic profile through the scraping code and times each part.
+# Every benchmark returns (seconds, units of work done).
+class ReplayBench:
+    def __init__(self, tb, posts, directory):
+        self.tb = tb
+        self.directory = directory
+        self.profile = FakeProfile(f"bench{posts}", posts, max(1, posts // 10), media_base_url=FAKE_CDN)
+        self.fixtures = os.path.join(directory, 'fixtures')
+        os.makedirs(self.fixtures)
+        self.urls = write_profile_fixtures(tb, self.profile, self.fixtures)
+
+    def pager(self, media_origin=None):
+        return GraphQLPager(ReplayTransport(self.fixtures, media_origin), PAGE_SIZE, Pacer(0))
+
+    def user(self, pager):
+        return self.tb.get_meta_data(self.tb.make_initial_request(pager, self.profile.name))[5]
+
+    def read(self, url):
+        with open(os.path.join(self.fixtures, fixture_name(url)), 'rb') as file:
+            return file.read()
+
+    # JSON decoding plus get_meta_data/get_timeline_links/get_igtv_links over bodies already in memory
+    def parse(self):
+        tb = self.tb
+        metadata = self.read(self.urls['profile'])
+        timeline = [self.read(url) for url in self.urls['timeline']]
+        igtv = [self.read(url) for url in self.urls['igtv']]
+        found = []
+        start = time.perf_counter()
+        user = tb.get_meta_data(Response(200, {}, metadata))[5]
+        tb.drain(tb.get_timeline_links(user['edge_owner_to_timeline_media']['edges'], 0), found.append)
+        tb.drain(tb.get_igtv_links(user['edge_felix_video_timeline']['edges'], 0), found.append)
+        for body in timeline:
+            edges = json.loads(body)['data']['user']['edge_owner_to_timeline_media']['edges']
+            tb.drain(tb.get_timeline_links(edges, 0), found.append)
+        for body in igtv:
+            edges = json.loads(body)['data']['user']['edge_felix_video_timeline']['edges']
+            tb.drain(tb.get_igtv_links(edges, 0), found.append)
+        return time.perf_counter() - start, len(self.profile.timeline) + len(self.profile.igtv)
+
+    # scrape_timeline() following every cursor through the replay transport
+    def pagination(self):
+        pager = self.pager()
+        user = self.user(pager)
+        found = []
+        start = time.perf_counter()
+        self.tb.drain(self.tb.scrape_timeline(pager, user, 0), found.append)
+        return time.perf_counter() - start, len(self.profile.timeline)
+
+    # The copy.deepcopy(user_dict) scrape_timeline() and scrape_igtv() each start with
+    def deepcopy(self):
+        user = self.user(self.pager())
+        start = time.perf_counter()
+        copy.deepcopy(user)
+        return time.perf_counter() - start, 1
+
+    # scrape_igtv() including the shortcode lookups
+    def igtv(self):
+        pager = self.pager()
+        user = self.user(pager)
+        cache = ShortcodeCache(os.path.join(tempfile.mkdtemp(dir=self.directory), 'shortcodes.jsonl'))
+        resolver = ShortcodeResolver(self.pager(), cache)
+        found = []
+        start = time.perf_counter()
+        self.tb.drain(self.tb.scrape_igtv(resolver, pager, user, 0), found.append)
+        return time.perf_counter() - start, len(self.profile.igtv)
+
+    # A whole scrape(), downloading every file from a local media server
+    def download(self, media_size, workers):
+        server, base_url = serve_directory(self.directory, synthetic_media_handler(media_size))
+        work = tempfile.mkdtemp(dir=self.directory)
+        cwd = os.getcwd()
+        self.tb.RESOLVE_INTERVAL = 0
+        try:
+            os.chdir(work)
+            store = StateStore(os.path.join(work, 'state.db'))
+            start = time.perf_counter()
+            self.tb.scrape(None, self.pager(base_url), self.profile.name, store, workers=workers)
+            elapsed = time.perf_counter() - start
+            files = store.connection.execute("SELECT COUNT(*) FROM posts").fetchone()[0]
+            store.close()
+        finally:
+            os.chdir(cwd)
+            server.shutdown()
+        return elapsed, files
+
+
+# Runs the replay benchmarks fully offline on synthetic profiles.
+# Results can be saved and compared against a previous run, exiting with status 1 on a regression.
+#
+# Usage: python -m bench.replay --posts 10 1000 50000 --save baseline.json
+#        python -m bench.replay --compare baseline.json
+def main():
+    parser = argparse.ArgumentParser(description='Offline replay benchmarks over synthetic GraphQL fixtures')
+    parser.add_argument('--posts', type=int, nargs='+', default=[10, 1000, 50000], help='synthetic profile sizes')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per benchmark; the fastest is reported')
+    parser.add_argument('--download-max', type=int, default=1000,
+                        help='largest profile the download benchmark runs on')
+    parser.add_argument('--media-size', type=int, default=64 * 1024, help='size of each served media file, in bytes')
+    parser.add_argument('--workers', type=int, default=8, help='download workers')
+    parser.add_argument('--save', type=str, metavar='PATH', help='write the results to PATH as JSON')
+    parser.add_argument('--compare', type=str, metavar='PATH', help='compare against results saved with --save')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='fraction a benchmark may slow down before it counts as a regression')
+    arguments = parser.parse_args()
+
+    tb = load_thirstbot()
+    results = {}
+    print(f"{'benchmark':<24} {'seconds':>10} {'units':>8} {'units/s':>12}")
+    for posts in arguments.posts:
+        with tempfile.TemporaryDirectory() as directory:
+            bench = ReplayBench(tb, posts, directory)
+            cases = [('parse', bench.parse), ('pagination', bench.pagination), ('deepcopy', bench.deepcopy),
+                     ('igtv', bench.igtv)]
+            if posts <= arguments.download_max:
+                cases.append(('download', lambda: bench.download(arguments.media_size, arguments.workers)))
+            for name, case in cases:
+                # The scraper reports its progress on stdout
+                with redirect_stdout(io.StringIO()):
+                    seconds, units = min(case() for _ in range(max(1, arguments.repeat)))
+                label = f"{name}[{posts}]"
+                results[label] = seconds
+                print(f"{label:<24} {seconds:>10.4f} {units:>8} {units / seconds if seconds else 0:>12.1f}")
+
+    if arguments.save:
+        with open(arguments.save, 'w') as file:
+            json.dump(results, file, indent=2)
+    if arguments.compare:
+        with open(arguments.compare) as file:
+            baseline = json.load(file)
+        regressions = [label for label, seconds in results.items()
+                       if label in baseline and seconds > baseline[label] * (1 + arguments.tolerance)]
+        for label in regressions:
+            print(f"REGRESSION {label}: {baseline[label]:.4f}s -> {results[label]:.4f}s")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
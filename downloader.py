@@ -0,0 +1,382 @@
+import hashlib
+import json
+import os
+import queue
+import re
+import shutil
+import threading
+import time
+import urllib.parse
+from collections import namedtuple
+from pathlib import Path
+
+from http_pool import LIMITER, ConnectionPool
+from metrics import METRICS
+
+# Number of files fetched at once. Downloads are bound by round-trips rather than bandwidth,
+# so a handful of workers hides most of the latency without hammering the CDN.
+DEFAULT_WORKERS = 8
+# Size of each block read from the socket and written to disk, so large videos are never held in memory
+CHUNK_SIZE = 64 * 1024
+# Number of discovered URLs allowed to wait for a download worker before pagination is held back
+QUEUE_SIZE = 64
+
+POOL = ConnectionPool()
+
+# A piece of media found while scraping: its kind ('image', 'video' or 'igtv'), direct URL,
+# the shortcode and timestamp of the post it belongs to, and its own media ID.
+# The media ID stays the same across scrapes, unlike the signed URL.
+Media = namedtuple('Media', ['kind', 'url', 'shortcode', 'taken_at', 'media_id'])
+
+
+class DownloadError(Exception):
+    def __init__(self, url, status, reason):
+        super().__init__(f"{status} {reason} while downloading {url}")
+        self.url = url
+        self.status = status
+
+
+# Identifies a media item by the file name at the end of its CDN URL.
+# The query string holds signatures that change between requests, so it is left out.
+def media_key(url):
+    return os.path.basename(urllib.parse.urlsplit(url).path)
+
+
+# Streams a single URL to disk in CHUNK_SIZE blocks over a pooled connection.
+# Data goes to "<file_name>.part" and is renamed into place only once complete, so an interrupted
+# download never leaves a truncated file under the real name. If a .part file is left over from an
+# earlier attempt, only the missing bytes are requested when the server supports HTTP Range. A .part the
+# server reports as already complete (416) is finished off, and one it can't resume from is started over.
+#
+# The URL path and validator the .part was started from are kept in "<file_name>.part.source". A .part
+# from another path, e.g. a different rendition of the same media, is started over, and the validator is
+# sent as If-Range so the server sends the whole file instead of a range if it has changed since.
+#
+# returns:  number of bytes in the finished file, its SHA-256 hex digest, and the number of bytes read from
+#           the network for it, which leaves out any resumed from the .part
+def fetch_to_file(url, file_name, pool=POOL, chunk_size=CHUNK_SIZE):
+    with LIMITER.slot():
+        start = time.perf_counter()
+        try:
+            size, checksum, transferred = _fetch_to_file(url, file_name, pool, chunk_size)
+        except DownloadError:
+            raise
+        except Exception:
+            # a response abandoned half-read would break the connection's next request
+            pool.discard(*urllib.parse.urlsplit(url)[:2])
+            raise
+        elapsed = time.perf_counter() - start
+    METRICS.add('file download', elapsed)
+    METRICS.file(elapsed, transferred)
+    return size, checksum, transferred
+
+
+def _fetch_to_file(url, file_name, pool, chunk_size):
+    part_name = file_name + ".part"
+    path = urllib.parse.urlsplit(url).path
+    source = read_source(part_name)
+    offset = 0
+    headers = {}
+    if os.path.exists(part_name) and source is not None and source['path'] == path:
+        offset = os.path.getsize(part_name)
+    if offset:
+        headers['Range'] = f"bytes={offset}-"
+        if source['validator']:
+            headers['If-Range'] = source['validator']
+    response = pool.request('GET', url, headers)
+    if response.status == 416 and offset:
+        response.read()
+        if content_range(response.getheader('Content-Range'))[1] == offset:
+            # the .part was already complete; only the rename was missed
+            digest = file_digest(part_name, chunk_size)
+            os.replace(part_name, file_name)
+            os.remove(part_name + ".source")
+            return offset, digest.hexdigest(), 0
+        os.remove(part_name)
+        return _fetch_to_file(url, file_name, pool, chunk_size)
+    if response.status == 206:
+        if content_range(response.getheader('Content-Range'))[0] != offset:
+            # not the bytes that were asked for, so the .part can't be trusted
+            pool.discard(*urllib.parse.urlsplit(url)[:2])
+            os.remove(part_name)
+            return _fetch_to_file(url, file_name, pool, chunk_size)
+        digest = file_digest(part_name, chunk_size)
+        mode = 'ab'
+    elif response.status == 200:
+        write_source(part_name, path, response)
+        digest = hashlib.sha256()
+        offset = 0
+        mode = 'wb'
+    else:
+        response.read()
+        raise DownloadError(url, response.status, response.reason)
+
+    expected = response.getheader('Content-Length')
+    size = offset
+    with open(part_name, mode) as file:
+        while True:
+            chunk = response.read(chunk_size)
+            if not chunk:
+                break
+            file.write(chunk)
+            digest.update(chunk)
+            size += len(chunk)
+        file.flush()
+        os.fsync(file.fileno())
+    if expected is not None and size - offset != int(expected):
+        pool.discard(*urllib.parse.urlsplit(url)[:2])
+        raise DownloadError(url, response.status, f"connection closed after {size - offset} of {expected} bytes")
+    os.replace(part_name, file_name)
+    os.remove(part_name + ".source")
+    return size, digest.hexdigest(), size - offset
+
+
+# The URL path and validator a .part was started from, or None if there's no readable record of them
+def read_source(part_name):
+    try:
+        with open(part_name + ".source") as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+# Records where a .part's bytes come from before any are written. The validator is the response's ETag,
+# or its Last-Modified date when the ETag is missing or weak, since If-Range only accepts strong ones.
+def write_source(part_name, path, response):
+    etag = response.getheader('ETag')
+    validator = etag if etag and not etag.startswith('W/') else response.getheader('Last-Modified')
+    with open(part_name + ".source", 'w') as file:
+        json.dump({'path': path, 'validator': validator}, file)
+
+
+# Reads a "bytes <first>-<last>/<total>" or "bytes */<total>" Content-Range header
+#
+# returns:  the first byte and the total size, each None if the header doesn't give it
+def content_range(header):
+    match = re.fullmatch(r'bytes (?:(\d+)-\d+|\*)/(\d+|\*)', (header or '').strip())
+    if match is None:
+        return None, None
+    first, total = match.groups()
+    return int(first) if first is not None else None, int(total) if total != '*' else None
+
+
+def file_digest(path, chunk_size=CHUNK_SIZE):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest
+
+
+# Replaces file_name with a hard link to source, so identical media only takes up disk space once.
+# File systems without hard links keep the separate copy.
+def link_over(source, file_name):
+    temporary = file_name + ".link"
+    try:
+        os.link(source, temporary)
+    except OSError:
+        return False
+    os.replace(temporary, file_name)
+    return True
+
+
+# Downloads media while it is still being discovered. Media is put() on a bounded queue that worker
+# threads consume from, so the first file starts downloading as soon as the first page is parsed and
+# the producer is held back when it gets too far ahead of the downloads.
+#
+# Final file names count down from the total number of items of each kind, which is only known once
+# pagination has finished. Files are therefore saved under a hidden staging name in their target
+# directory and finish() renames them to the <name>_<count> scheme afterwards, above last_number().
+#
+# Media is identified by its media ID. Items the manifest shows are already on disk, and items seen
+# earlier in the same scrape (e.g. a sidecar child that was also posted alone), are skipped entirely:
+# they are not downloaded and don't use up a number. An item seen earlier under another kind, e.g. an
+# IGTV video that was also shared to the feed, is still saved and numbered under its own kind, but as a
+# copy of the first file made by close() rather than a second download.
+#
+# targets:     dict of media kind to (directory, stem, extension), e.g. {'image': (path, 'profile', '.png')}
+# workers:     number of download threads
+# manifest:    optional Manifest used to skip finished files and record new ones
+# queue_size:  maximum number of items waiting for a worker
+# link:        when True, a new file whose content matches a file already on disk is replaced by a hard link to it,
+#              and copies of an item saved under another kind are hard links too
+class MediaStream:
+    def __init__(self, targets, workers=DEFAULT_WORKERS, manifest=None, pool=POOL, quiet=False,
+                 queue_size=QUEUE_SIZE, link=False):
+        self.targets = targets
+        self.manifest = manifest
+        self.pool = pool
+        self.quiet = quiet
+        self.link = link
+        self.staged = {kind: [] for kind in targets}
+        self.existing = []
+        self.downloaded = 0
+        self.skipped = 0
+        self.linked = 0
+        self.errors = []
+        # key of every item put so far, to its kind and its staged or saved path
+        self._keys = {}
+        # (first file, key, staged name) of every item that is a copy of one saved under another kind
+        self._copies = []
+        self._lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._threads = [threading.Thread(target=self._work, daemon=True) for _ in range(max(1, workers))]
+        for thread in self._threads:
+            thread.start()
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                self.pool.release_thread()
+                return
+            key, url, file_name = job
+            try:
+                if self.manifest is not None and self.manifest.is_complete(key, file_name):
+                    continue
+                size, checksum, transferred = fetch_to_file(url, file_name, self.pool)
+                duplicate = self.manifest and self.manifest.add(key, file_name, size, checksum)
+                linked = bool(self.link and duplicate and link_over(duplicate, file_name))
+            except Exception as error:
+                print(f"Failed to save {url}: {error}")
+                with self._lock:
+                    self.errors.append(error)
+                continue
+            with self._lock:
+                self.downloaded += transferred
+                self.linked += linked
+            if linked:
+                METRICS.count('linked files')
+
+    # Where the item with this key is already saved under its final name, if the manifest lists it
+    def _present(self, key):
+        path = key and self.manifest.present(key)
+        if path and not os.path.basename(path).startswith("."):
+            return path
+        return None
+
+    # Where the media item is already saved under its final name, found by its media ID or, for manifests
+    # written before media IDs were used, by its CDN file name
+    def _saved_path(self, media):
+        for key in (media.media_id, media.url and media_key(media.url)):
+            path = self._present(key)
+            if path is not None:
+                return path
+        return None
+
+    # Whether put() would skip downloading the media item, because it's already saved or was put earlier
+    # in this scrape. Only the media ID is needed, so it can be checked before the item's URL is looked up.
+    def is_saved(self, media):
+        key = media.media_id or media_key(media.url)
+        return key in self._keys or (self.manifest is not None and self._saved_path(media) is not None)
+
+    # Queues a Media item for download, unless it is already saved. Blocks while the queue is full.
+    # Items already on disk are listed in `existing` with their path.
+    def put(self, media):
+        key = media.media_id or media_key(media.url)
+        first = self._keys.get(key)
+        if first is not None and first[0] != media.kind:
+            self._put_copy(media, key, first[1])
+            return
+        path = None if first is not None or self.manifest is None else self._saved_path(media)
+        if first is not None or path is not None:
+            if path is not None:
+                self.existing.append((media, path))
+                self._keys[key] = (media.kind, path)
+            self._skip()
+            return
+        file_name = self._stage(media, key)
+        # time spent here means pagination is outrunning the download workers
+        with METRICS.stage('download queue full'):
+            self._queue.put((key, media.url, file_name))
+
+    # Stages a copy of `source`, the file of an item put earlier under another kind. The copy has a key of
+    # its own in the manifest, so a later scrape finds it saved instead of making it again.
+    def _put_copy(self, media, key, source):
+        key = f"{key}@{media.kind}"
+        path = None if key in self._keys or self.manifest is None else self._present(key)
+        if key in self._keys or path is not None:
+            if path is not None:
+                self.existing.append((media, path))
+                self._keys[key] = (media.kind, path)
+            self._skip()
+            return
+        self._copies.append((source, key, self._stage(media, key)))
+
+    def _stage(self, media, key):
+        directory = self.targets[media.kind][0]
+        if not self.staged[media.kind]:
+            Path(directory).mkdir(parents=True, exist_ok=True)
+        file_name = os.path.join(directory, f".{key}")
+        self.staged[media.kind].append((media, key, file_name))
+        self._keys[key] = (media.kind, file_name)
+        return file_name
+
+    def _skip(self):
+        self.skipped += 1
+        METRICS.count('skipped files')
+
+    def count(self, kind):
+        return len(self.staged[kind])
+
+    # Waits for every queued download, then makes the copies of items saved under another kind.
+    # Raises the first error, if there was one.
+    def close(self):
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        for source, key, file_name in self._copies:
+            try:
+                linked = self.link and link_over(source, file_name)
+                if not linked:
+                    shutil.copyfile(source, file_name)
+                if self.manifest is not None:
+                    self.manifest.add(key, file_name, os.path.getsize(file_name), file_digest(file_name).hexdigest())
+            except OSError as error:
+                print(f"Failed to copy {source}: {error}")
+                self.errors.append(error)
+                continue
+            self.linked += linked
+            if linked:
+                METRICS.count('linked files')
+        if self.errors:
+            raise self.errors[0]
+
+    # Highest <stem>_<count> number of a kind that is already used, by a file on disk or in the manifest.
+    # New files have to be numbered above it, whatever the scrape state says, or they would replace old ones.
+    def last_number(self, kind):
+        directory, stem, extension = self.targets[kind]
+        pattern = re.compile(rf"{re.escape(stem)}_(\d+){re.escape(extension)}")
+        names = os.listdir(directory) if os.path.isdir(directory) else []
+        if self.manifest is not None:
+            names.extend(os.path.basename(entry['path']) for entry in self.manifest.entries.values()
+                         if os.path.dirname(entry['path']) == directory)
+        return max((int(match.group(1)) for match in map(pattern.fullmatch, names) if match), default=0)
+
+    # Renames staged files to their numbered names, counting down from `counts[kind]` for each kind.
+    # Raises FileExistsError, before renaming anything, if one of the names is already taken.
+    #
+    # returns:  list of (Media, file_name) pairs for every saved file
+    def finish(self, counts):
+        saved = []
+        renames = []
+        for kind, staged in self.staged.items():
+            directory, stem, extension = self.targets[kind]
+            count = counts[kind]
+            for media, key, staged_name in staged:
+                file_name = os.path.join(directory, f"{stem}_{count}{extension}")
+                saved.append((media, file_name))
+                renames.append((key, staged_name, file_name))
+                count -= 1
+        taken = [file_name for _, _, file_name in renames if os.path.exists(file_name)]
+        if taken:
+            raise FileExistsError(f"Not replacing {len(taken)} saved files, starting with {taken[0]}")
+        # a crash part way through then leaves names the manifest knows, which last_number() won't hand out again
+        if self.manifest is not None:
+            self.manifest.move((key, file_name) for key, _, file_name in renames)
+        for _, staged_name, file_name in renames:
+            os.replace(staged_name, file_name)
+            if not self.quiet:
+                print(file_name)
+        return saved
@@ -0,0 +1,126 @@
+import http.client
+import threading
+import urllib.parse
+from contextlib import contextmanager
+
+# Errors that mean a kept-alive connection was closed by the server between requests, or was left
+# mid-response by an earlier request. The request is retried once on a fresh connection when one of these is raised.
+STALE_CONNECTION_ERRORS = (http.client.RemoteDisconnected, http.client.ImproperConnectionState, BrokenPipeError,
+                           ConnectionResetError)
+REDIRECT_CODES = (301, 302, 303, 307, 308)
+
+
+# Caps the number of HTTP requests in flight across the whole process, whichever pool they go through.
+# There is no cap until set_limit() is called.
+class RequestLimiter:
+    def __init__(self):
+        self._semaphore = None
+
+    def set_limit(self, limit):
+        self._semaphore = threading.BoundedSemaphore(limit) if limit else None
+
+    # Held for the whole request, including reading the response body
+    @contextmanager
+    def slot(self):
+        semaphore = self._semaphore
+        if semaphore is None:
+            yield
+            return
+        with semaphore:
+            yield
+
+
+LIMITER = RequestLimiter()
+
+
+# Keeps one HTTP(S) connection per host per thread so that repeated requests to the same CDN
+# reuse a single TCP/TLS connection instead of paying a handshake for every file.
+# A thread's connections are closed by release_thread() when it is done with the pool, and connections
+# of threads that ended without calling it are closed the next time a connection is opened.
+#
+# timeout:  socket timeout, in seconds, for every connection created by the pool
+class ConnectionPool:
+    def __init__(self, timeout=30):
+        self.timeout = timeout
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        # every open connection, mapped to the thread that uses it
+        self._owners = {}
+
+    def _connections(self):
+        connections = getattr(self._local, 'connections', None)
+        if connections is None:
+            connections = self._local.connections = {}
+        return connections
+
+    def get(self, scheme, netloc):
+        connections = self._connections()
+        connection = connections.get((scheme, netloc))
+        if connection is None:
+            if scheme == 'https':
+                connection = http.client.HTTPSConnection(netloc, timeout=self.timeout)
+            else:
+                connection = http.client.HTTPConnection(netloc, timeout=self.timeout)
+            connections[(scheme, netloc)] = connection
+            with self._lock:
+                self._owners[connection] = threading.current_thread()
+                orphans = [orphan for orphan, owner in self._owners.items() if not owner.is_alive()]
+                for orphan in orphans:
+                    del self._owners[orphan]
+            for orphan in orphans:
+                orphan.close()
+        return connection
+
+    # Drops the calling thread's connection to a host, e.g. after a response was abandoned half-read
+    def discard(self, scheme, netloc):
+        connection = self._connections().pop((scheme, netloc), None)
+        if connection is not None:
+            self._forget([connection])
+
+    # Closes every connection of the calling thread, e.g. when a worker thread is about to exit
+    def release_thread(self):
+        connections = list(self._connections().values())
+        self._local.connections = {}
+        self._forget(connections)
+
+    def _forget(self, connections):
+        with self._lock:
+            for connection in connections:
+                self._owners.pop(connection, None)
+        for connection in connections:
+            connection.close()
+
+    # Sends a request and returns the open http.client.HTTPResponse. Redirects are followed.
+    # The caller must read the response to the end (or call discard) before reusing the connection.
+    def request(self, method, url, headers=None, max_redirects=5):
+        headers = dict(headers or {})
+        for _ in range(max_redirects + 1):
+            parts = urllib.parse.urlsplit(url)
+            target = urllib.parse.urlunsplit(('', '', parts.path or '/', parts.query, ''))
+            response = self._send(parts.scheme, parts.netloc, method, target, headers)
+            location = response.getheader('Location')
+            if response.status not in REDIRECT_CODES or location is None:
+                return response
+            response.read()
+            url = urllib.parse.urljoin(url, location)
+        raise http.client.HTTPException(f"Too many redirects for {url}")
+
+    def _send(self, scheme, netloc, method, target, headers):
+        for attempt in range(2):
+            connection = self.get(scheme, netloc)
+            try:
+                connection.request(method, target, headers=headers)
+                return connection.getresponse()
+            except STALE_CONNECTION_ERRORS:
+                self.discard(scheme, netloc)
+                if attempt:
+                    raise
+            except Exception:
+                self.discard(scheme, netloc)
+                raise
+
+    def close(self):
+        with self._lock:
+            connections, self._owners = list(self._owners), {}
+        for connection in connections:
+            connection.close()
@@ -0,0 +1,101 @@
+import json
+import os
+import threading
+
+MANIFEST_NAME = "manifest.jsonl"
+
+
+# Per-profile record of every media file that finished downloading, with its size and SHA-256 checksum.
+# Entries are appended one JSON object per line as each file completes, so a crash loses at most the
+# line being written. A later line for the same key replaces an earlier one, and the file is rewritten
+# without the replaced lines once they make up more than half of it.
+# Entries are also indexed by checksum, so a file whose content is already on disk can be spotted.
+#
+# path:  location of the manifest file, normally <profile>/manifest.jsonl
+class Manifest:
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        self._by_checksum = {}
+        self._lock = threading.Lock()
+        lines = 0
+        if os.path.exists(path):
+            with open(path) as file:
+                for line in file:
+                    lines += 1
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # a line cut short by a crash
+                        continue
+                    self.entries[entry['key']] = entry
+                    if entry['sha256']:
+                        self._by_checksum[entry['sha256']] = entry
+        if lines > 2 * len(self.entries):
+            self.compact()
+
+    def get(self, key):
+        return self.entries.get(key)
+
+    # Where the media item was saved, if that file is still on disk with the recorded size
+    def present(self, key):
+        entry = self.entries.get(key)
+        if entry is not None and self.is_complete(key, entry['path']):
+            return entry['path']
+        return None
+
+    # Whether the media item was already saved to file_name and the file on disk still has the recorded size
+    def is_complete(self, key, file_name):
+        entry = self.entries.get(key)
+        if entry is None or entry['path'] != file_name:
+            return False
+        try:
+            return os.path.getsize(file_name) == entry['size']
+        except OSError:
+            return False
+
+    # Records a finished file
+    #
+    # returns:  path of a different media item's file with identical content, if one is on disk, otherwise None
+    def add(self, key, file_name, size, checksum):
+        entry = {'key': key, 'path': file_name, 'size': size, 'sha256': checksum}
+        with self._lock:
+            duplicate = self._by_checksum.get(checksum) if checksum else None
+            if duplicate is None or duplicate['key'] == key or duplicate['size'] != size or \
+                    not os.path.exists(duplicate['path']):
+                duplicate = None
+                if checksum:
+                    self._by_checksum[checksum] = entry
+            self.entries[key] = entry
+            self._append([entry])
+        return duplicate and duplicate['path']
+
+    # Records that already listed files now live under new names, with a single write and fsync
+    #
+    # moves:  iterable of (key, new file_name) pairs
+    def move(self, moves):
+        with self._lock:
+            entries = []
+            for key, file_name in moves:
+                entry = dict(self.entries[key], path=file_name)
+                self.entries[key] = entry
+                if entry['sha256'] and self._by_checksum.get(entry['sha256'], {}).get('key') == key:
+                    self._by_checksum[entry['sha256']] = entry
+                entries.append(entry)
+            if entries:
+                self._append(entries)
+
+    # Rewrites the file with only the latest line of each entry
+    def compact(self):
+        with self._lock:
+            with open(self.path + ".tmp", 'w') as file:
+                file.writelines(json.dumps(entry) + "\n" for entry in self.entries.values())
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(self.path + ".tmp", self.path)
+
+    def _append(self, entries):
+        with open(self.path, 'a') as file:
+            file.writelines(json.dumps(entry) + "\n" for entry in entries)
+            file.flush()
+            os.fsync(file.fileno())
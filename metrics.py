@@ -0,0 +1,116 @@
+import csv
+import json
+import math
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+# Stages that are spent waiting on the network, as opposed to sleeping or parsing
+IO_STAGES = ('api request', 'file download')
+
+
+# Value below which `fraction` of the sorted values fall, using the nearest-rank method
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    index = max(0, min(len(values) - 1, math.ceil(fraction * len(values)) - 1))
+    return values[index]
+
+
+# Collects where a run's time goes: how long each stage took, how many pages and bytes were fetched,
+# how long each file took to download, and how much time was spent in deliberate sleeps.
+# Stages running on several threads at once add up, so their total can exceed the run's wall-clock time.
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started = time.perf_counter()
+            self.stages = defaultdict(lambda: [0, 0.0])
+            self.counters = defaultdict(int)
+            self.sleeps = defaultdict(float)
+            self.file_latencies = []
+
+    def add(self, name, seconds):
+        with self._lock:
+            stage = self.stages[name]
+            stage[0] += 1
+            stage[1] += seconds
+
+    # Times the block as one call of the named stage
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def count(self, name, amount=1):
+        with self._lock:
+            self.counters[name] += amount
+
+    # Records one downloaded file
+    def file(self, seconds, size):
+        with self._lock:
+            self.file_latencies.append(seconds)
+            self.counters['files'] += 1
+            self.counters['bytes downloaded'] += size
+
+    # time.sleep() that is recorded as deliberate waiting, under reason
+    def sleep(self, seconds, reason):
+        if seconds <= 0:
+            return
+        time.sleep(seconds)
+        with self._lock:
+            self.sleeps[reason] += seconds
+
+    def summary(self):
+        with self._lock:
+            latencies = sorted(self.file_latencies)
+            stages = {name: {'calls': calls, 'seconds': round(seconds, 6)}
+                      for name, (calls, seconds) in sorted(self.stages.items())}
+            sleep_seconds = sum(self.sleeps.values())
+            return {
+                'wall seconds'  : round(time.perf_counter() - self.started, 6),
+                'stages'        : stages,
+                'counters'      : dict(sorted(self.counters.items())),
+                'sleep seconds' : {reason: round(seconds, 6) for reason, seconds in sorted(self.sleeps.items())},
+                'io seconds'    : round(sum(stages.get(name, {}).get('seconds', 0) for name in IO_STAGES), 6),
+                'total sleep'   : round(sleep_seconds, 6),
+                'file latency'  : {
+                    'count': len(latencies),
+                    'p50'  : round(percentile(latencies, 0.50), 6),
+                    'p90'  : round(percentile(latencies, 0.90), 6),
+                    'p99'  : round(percentile(latencies, 0.99), 6),
+                    'max'  : round(latencies[-1], 6) if latencies else 0.0
+                }
+            }
+
+    # Writes the summary to path, as CSV if the name ends in .csv and as JSON otherwise
+    def write(self, path):
+        summary = self.summary()
+        if path.endswith('.csv'):
+            with open(path, 'w', newline='') as file:
+                writer = csv.writer(file)
+                writer.writerow(['metric', 'value'])
+                for name, value in flatten(summary):
+                    writer.writerow([name, value])
+        else:
+            with open(path, 'w') as file:
+                json.dump(summary, file, indent=2)
+
+
+# Turns a nested summary into ("stages.login.seconds", value) pairs
+def flatten(summary, prefix=''):
+    for name, value in summary.items():
+        if isinstance(value, dict):
+            yield from flatten(value, f"{prefix}{name}.")
+        else:
+            yield f"{prefix}{name}", value
+
+
+METRICS = Metrics()
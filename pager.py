@@ -0,0 +1,158 @@
+import json
+import threading
+import time
+import urllib.parse
+from collections import namedtuple
+from random import uniform
+
+from http_pool import LIMITER, ConnectionPool
+from metrics import METRICS
+
+# Number of posts requested per GraphQL page. Instagram allows up to 50.
+PAGE_SIZE = 30
+# Minimum number of seconds between two page requests. Replaces the fixed sleep(3) before every page.
+PAGE_INTERVAL = 3.0
+# Public web app ID Instagram's own frontend sends with its API calls
+IG_APP_ID = '936619743392459'
+
+# Response to a single HTTP request. Same shape as a selenium-wire response, so get_meta_data() accepts either.
+Response = namedtuple('Response', ['status', 'headers', 'body'])
+
+
+class PagerError(Exception):
+    def __init__(self, url, status, reason):
+        super().__init__(f"{status} {reason} from {url}")
+        self.url = url
+        self.status = status
+
+
+# URL of the JSON endpoint holding a profile's metadata and the first page of its posts
+def profile_url(profile_name):
+    return f"https://www.instagram.com/{profile_name}/?__a=1"
+
+
+# Spaces requests at least `interval` seconds apart, plus up to `jitter` random seconds.
+# Time spent waiting on the network counts towards the interval, so a slow page is not followed by a full sleep.
+class Pacer:
+    def __init__(self, interval=PAGE_INTERVAL, jitter=0.0):
+        self.interval = interval
+        self.jitter = jitter
+        self._lock = threading.Lock()
+        self._next = 0.0
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            if delay > 0:
+                METRICS.sleep(delay, 'pacing')
+                now += delay
+            self._next = now + self.interval + (uniform(0, self.jitter) if self.jitter else 0)
+
+    # Pushes the next request back, e.g. after Instagram answers 429
+    def back_off(self, seconds):
+        with self._lock:
+            self._next = max(self._next, time.monotonic() + seconds)
+
+
+# Sends GETs over pooled connections with a fixed set of cookies and headers
+#
+# cookies:  dict of cookie names to values, normally taken from the logged-in browser
+# headers:  extra headers sent with every request
+# origin:   optional "scheme://host:port" every request is redirected to, e.g. a local fake server
+class HttpTransport:
+    def __init__(self, cookies=None, headers=None, origin=None, pool=None):
+        self.headers = dict(headers or {})
+        if cookies:
+            self.headers['Cookie'] = "; ".join(f"{name}={value}" for name, value in cookies.items())
+            if 'csrftoken' in cookies:
+                self.headers['X-CSRFToken'] = cookies['csrftoken']
+        self.origin = urllib.parse.urlsplit(origin) if origin else None
+        self.pool = pool or ConnectionPool()
+
+    def get(self, url):
+        if self.origin is not None:
+            url = urllib.parse.urlunsplit(self.origin[:2] + urllib.parse.urlsplit(url)[2:])
+        with LIMITER.slot():
+            response = self.pool.request('GET', url, self.headers)
+            try:
+                body = response.read()
+            except Exception:
+                self.pool.discard(*urllib.parse.urlsplit(url)[:2])
+                raise
+            return Response(response.status, dict(response.getheaders()), body)
+
+
+# Builds an HttpTransport that carries the logged-in browser's session, so API pages can be
+# fetched directly instead of being rendered by the browser
+def session_from_browser(browser):
+    cookies = {cookie['name']: cookie['value'] for cookie in browser.get_cookies()}
+    headers = {
+        'User-Agent'      : browser.execute_script("return navigator.userAgent;"),
+        'X-IG-App-ID'     : IG_APP_ID,
+        'X-Requested-With': 'XMLHttpRequest',
+        'Referer'         : 'https://www.instagram.com/'
+    }
+    return HttpTransport(cookies, headers)
+
+
+# builds request to fetch a page from Facebook's GraphQL
+# Used to iterate through an Instagram's content via the API rather than visiting each post manually
+#
+# user_id:      ID of the target profile
+# end_cursor:   The cursor code for where the next page of content starts in the API
+# query_hash:   The hash code for the query. Timeline and IGTV posts use different codes.
+# page_size:    Number of posts on the page
+def build_request(user_id, end_cursor, query_hash, page_size=PAGE_SIZE):
+    if end_cursor is None:
+        raise ValueError
+    meta = {
+        'id'   : user_id,
+        'first': page_size,
+        'after': end_cursor
+    }
+    parameters = {
+        'query_hash': query_hash,
+        'variables' : json.dumps(meta)
+    }
+    return "https://www.instagram.com/graphql/query/?" + urllib.parse.urlencode(parameters)
+
+
+# Fetches profile metadata and GraphQL pages straight over HTTP, paced by a Pacer
+#
+# transport:  object with a get(url) method returning a Response, e.g. HttpTransport
+# page_size:  number of posts requested per page
+# pacer:      Pacer spacing out the requests
+# retries:    number of times a rate-limited (429) request is retried, backing off a little longer each time
+class GraphQLPager:
+    def __init__(self, transport, page_size=PAGE_SIZE, pacer=None, retries=3):
+        self.transport = transport
+        self.page_size = page_size
+        self.pacer = pacer if pacer is not None else Pacer()
+        self.retries = retries
+
+    def get(self, url):
+        for attempt in range(self.retries + 1):
+            self.pacer.wait()
+            with METRICS.stage('api request'):
+                response = self.transport.get(url)
+            if response.status != 429 or attempt == self.retries:
+                return response
+            METRICS.count('rate limited')
+            self.pacer.back_off(self.pacer.interval * 2 ** (attempt + 2))
+        return response
+
+    def get_json(self, url):
+        response = self.get(url)
+        if response.status != 200:
+            raise PagerError(url, response.status, "response")
+        return json.loads(response.body.decode('utf-8'))
+
+    # Response of the profile's '?__a=1' endpoint, for get_meta_data()
+    def profile(self, profile_name):
+        return self.get(profile_url(profile_name))
+
+    # The 'user' object of the page after end_cursor
+    def next_page(self, user_id, end_cursor, query_hash):
+        METRICS.count('pages')
+        return self.get_json(build_request(user_id, end_cursor, query_hash, self.page_size))['data']['user']
@@ -0,0 +1,66 @@
+import hashlib
+import json
+import os
+import re
+import urllib.parse
+
+from pager import Response
+
+# Matches the scheme and host of Instagram CDN URLs, including the "https:\/\/" form escaped JSON uses
+CDN_ORIGIN = re.compile(rb'https:(?:\\?/){2}[A-Za-z0-9.-]+\.(?:cdninstagram\.com|fbcdn\.net)')
+
+
+# File name a response to url is recorded under. GraphQL pages are named by their query hash, profile ID,
+# page size and cursor, so the same request always maps to the same fixture.
+def fixture_name(url):
+    parts = urllib.parse.urlsplit(url)
+    query = urllib.parse.parse_qs(parts.query)
+    if parts.path == '/graphql/query/':
+        variables = json.loads(query['variables'][0])
+        key = f"{query['query_hash'][0]}|{variables.get('id')}|{variables.get('first')}|{variables.get('after')}"
+        prefix = 'query'
+    else:
+        key = f"{parts.path}?{parts.query}"
+        prefix = re.sub('[^a-zA-Z0-9_]', '_', parts.path.strip('/')) or 'index'
+    return f"{prefix}_{hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]}.json"
+
+
+# Wraps a transport and saves every successful response into directory, named by fixture_name()
+#
+# transport:  the transport doing the real requests, e.g. the HttpTransport from session_from_browser()
+# directory:  folder the fixtures are written to
+class RecordingTransport:
+    def __init__(self, transport, directory):
+        self.transport = transport
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def get(self, url):
+        response = self.transport.get(url)
+        if response.status == 200:
+            file_name = os.path.join(self.directory, fixture_name(url))
+            with open(file_name + ".tmp", 'wb') as file:
+                file.write(response.body)
+            os.replace(file_name + ".tmp", file_name)
+        return response
+
+
+# Answers requests from fixtures recorded by RecordingTransport, without touching the network.
+# Requests with no fixture get a 404.
+#
+# directory:     folder holding the fixtures
+# media_origin:  optional "scheme://host:port" that CDN URLs in the responses are pointed at, e.g. a local server
+class ReplayTransport:
+    def __init__(self, directory, media_origin=None):
+        self.directory = directory
+        self.media_origin = media_origin.encode('utf-8') if media_origin else None
+
+    def get(self, url):
+        try:
+            with open(os.path.join(self.directory, fixture_name(url)), 'rb') as file:
+                body = file.read()
+        except FileNotFoundError:
+            return Response(404, {}, b'')
+        if self.media_origin is not None:
+            body = CDN_ORIGIN.sub(self.media_origin, body)
+        return Response(200, {'Content-Type': 'application/json'}, body)
@@ -0,0 +1,127 @@
+import json
+import os
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import METRICS
+from pager import PagerError
+
+# Number of IGTV posts looked up at once
+RESOLVE_WORKERS = 4
+# Minimum number of seconds between two post lookups
+RESOLVE_INTERVAL = 0.5
+# How long a cached URL is trusted when it carries no expiry of its own, in seconds
+CACHE_TTL = 24 * 60 * 60
+CACHE_NAME = "shortcodes.jsonl"
+
+
+# Reads the video URL out of a post's '?__a=1' JSON, in either the old 'graphql' or the newer 'items' layout
+#
+# returns:  the URL, or None if the post has none
+def video_url_from_post(body):
+    media = body.get('graphql', {}).get('shortcode_media')
+    if media is not None:
+        return media.get('video_url')
+    for item in body.get('items', []):
+        versions = item.get('video_versions')
+        if versions:
+            return versions[0]['url']
+    return None
+
+
+# Unix time at which a signed CDN URL stops working. Instagram encodes it in hex in the 'oe' parameter.
+def url_expiry(url, resolved_at):
+    expiry = urllib.parse.parse_qs(urllib.parse.urlsplit(url).query).get('oe')
+    if expiry:
+        try:
+            return int(expiry[0], 16)
+        except ValueError:
+            pass
+    return resolved_at + CACHE_TTL
+
+
+# Persistent map of IGTV shortcodes to their video URLs, one JSON object per line.
+# Entries whose URL has expired are ignored, since the CDN would refuse them.
+#
+# path:  location of the cache file, normally <profile>/shortcodes.jsonl
+class ShortcodeCache:
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path) as file:
+                for line in file:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    self.entries[entry['shortcode']] = entry
+
+    def get(self, shortcode):
+        entry = self.entries.get(shortcode)
+        if entry is None or entry['expires'] <= time.time():
+            return None
+        return entry['url']
+
+    def put(self, shortcode, url):
+        now = time.time()
+        entry = {'shortcode': shortcode, 'url': url, 'expires': url_expiry(url, now)}
+        with self._lock:
+            self.entries[shortcode] = entry
+            with open(self.path, 'a') as file:
+                file.write(json.dumps(entry) + "\n")
+
+
+# Turns IGTV shortcodes into direct video URLs.
+# Each post's JSON is fetched over HTTP; the browser is only used when the JSON has no video URL.
+# Several posts are resolved at once and every result is remembered in the cache. The same worker
+# threads, and so the same pooled connections, serve every batch until close() is called.
+#
+# pager:     GraphQLPager used to fetch the post JSON
+# cache:     ShortcodeCache holding previously resolved URLs
+# fallback:  optional function taking a shortcode and returning its URL by other means, e.g. from the page's DOM.
+#            It may be called from several threads at once.
+# workers:   number of posts resolved at once
+class ShortcodeResolver:
+    def __init__(self, pager, cache, fallback=None, workers=RESOLVE_WORKERS):
+        self.pager = pager
+        self.cache = cache
+        self.fallback = fallback
+        self.workers = workers
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers))
+
+    def resolve(self, shortcode, known_url=None):
+        if known_url is not None:
+            return known_url
+        url = self.cache.get(shortcode)
+        if url is not None:
+            METRICS.count('shortcode cache hits')
+            return url
+        try:
+            url = video_url_from_post(self.pager.get_json(f"https://www.instagram.com/tv/{shortcode}/?__a=1"))
+        except (PagerError, ValueError) as error:
+            print(f"Couldn't read {shortcode}'s JSON ({error})")
+            url = None
+        if url is None:
+            if self.fallback is None:
+                raise LookupError(f"No video URL found for {shortcode}")
+            METRICS.count('shortcode DOM fallbacks')
+            url = self.fallback(shortcode)
+        self.cache.put(shortcode, url)
+        return url
+
+    # Resolves a batch of (shortcode, known_url) pairs at once
+    #
+    # returns:  the URLs, in the same order as the pairs
+    def resolve_many(self, pairs):
+        if not pairs:
+            return []
+        with METRICS.stage('shortcode resolution'):
+            return list(self._executor.map(lambda pair: self.resolve(*pair), pairs))
+
+    # Stops the worker threads once every batch is resolved
+    def close(self):
+        self._executor.shutdown()
@@ -0,0 +1,103 @@
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+STATE_NAME = "state.db"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS subjects (
+    name          TEXT PRIMARY KEY,
+    date_last     INTEGER NOT NULL DEFAULT 0,
+    igtv_last     INTEGER NOT NULL DEFAULT 0,
+    image_count   INTEGER NOT NULL DEFAULT 0,
+    video_count   INTEGER NOT NULL DEFAULT 0,
+    igtv_count    INTEGER NOT NULL DEFAULT 0,
+    timeline_size INTEGER NOT NULL DEFAULT 0,
+    igtv_size     INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS posts (
+    path       TEXT PRIMARY KEY,
+    profile    TEXT NOT NULL,
+    shortcode  TEXT,
+    taken_at   INTEGER,
+    media_type TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS posts_by_profile ON posts (profile, shortcode);
+"""
+
+# Column names in the subjects table, in the same order as the keys made by subject_builder()
+SUBJECT_COLUMNS = ('name', 'date_last', 'igtv_last', 'image_count', 'video_count', 'igtv_count', 'timeline_size',
+                   'igtv_size')
+SUBJECT_KEYS = ('name', 'date-last', 'igtv-last', 'image-count', 'video-count', 'igtv-count', 'timeline-size',
+                'igtv-size')
+
+
+# SQLite-backed scrape state: one row per scraped profile, looked up by name, and one row per saved media file.
+# Writes happen inside transaction(), so a crash leaves either all of a profile's changes or none of them.
+# A single connection is shared between threads and serialised with a lock.
+#
+# path:  location of the database file, normally state.db next to user.json
+class StateStore:
+    def __init__(self, path):
+        self.path = path
+        self.connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._lock = threading.RLock()
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(SCHEMA)
+
+    @contextmanager
+    def transaction(self):
+        with self._lock:
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield self
+            except BaseException:
+                self.connection.execute("ROLLBACK")
+                raise
+            self.connection.execute("COMMIT")
+
+    # Metadata about a previously scraped profile, in the format made by subject_builder(), or None
+    def get_subject(self, name):
+        with self._lock:
+            row = self.connection.execute(
+                f"SELECT {', '.join(SUBJECT_COLUMNS)} FROM subjects WHERE name = ?", (name,)).fetchone()
+        if row is None:
+            return None
+        return dict(zip(SUBJECT_KEYS, row))
+
+    def put_subject(self, subject):
+        with self._lock:
+            self.connection.execute(
+                f"INSERT OR REPLACE INTO subjects ({', '.join(SUBJECT_COLUMNS)}) "
+                f"VALUES ({', '.join('?' * len(SUBJECT_COLUMNS))})",
+                tuple(subject[key] for key in SUBJECT_KEYS))
+
+    # Forgets a profile and its posts. Files already saved are left on disk.
+    def delete_subject(self, name):
+        with self.transaction():
+            self.connection.execute("DELETE FROM subjects WHERE name = ?", (name,))
+            self.connection.execute("DELETE FROM posts WHERE profile = ?", (name,))
+
+    def names(self):
+        with self._lock:
+            return [row[0] for row in self.connection.execute("SELECT name FROM subjects ORDER BY name")]
+
+    # Records saved media files
+    #
+    # profile:  name of the profile the media belongs to
+    # records:  iterable of (shortcode, taken_at_timestamp, media_type, path) tuples
+    def add_posts(self, profile, records):
+        with self._lock:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO posts (path, profile, shortcode, taken_at, media_type) VALUES (?, ?, ?, ?, ?)",
+                ((path, profile, shortcode, taken_at, media_type) for shortcode, taken_at, media_type, path in records))
+
+    # Imports the 'subjects' list of an old user.json. Their positional 'index' field is no longer needed.
+    def migrate(self, subjects):
+        with self.transaction():
+            for subject in subjects:
+                self.put_subject({key: subject.get(key, 0) for key in SUBJECT_KEYS})
+
+    def close(self):
+        self.connection.close()
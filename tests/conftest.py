@@ -0,0 +1,95 @@
+import io
+import os
+from contextlib import redirect_stdout
+
+import pytest
+
+from bench.fake_graphql import FakeProfile
+from bench.fixture_server import serve_directory, synthetic_media_handler
+from bench.replay import FAKE_CDN, load_thirstbot, write_profile_fixtures
+from pager import PAGE_SIZE, GraphQLPager, Pacer
+from replay import ReplayTransport
+from state import STATE_NAME, StateStore
+
+# Size of every file served by the media server. Each one has the same content.
+MEDIA_SIZE = 4096
+
+
+# ReplayTransport that remembers every URL it was asked for
+class CountingTransport(ReplayTransport):
+    def __init__(self, directory, media_origin=None):
+        super().__init__(directory, media_origin)
+        self.urls = []
+
+    def get(self, url):
+        self.urls.append(url)
+        return super().get(url)
+
+
+# The main script, imported once. Skipped when the browser packages it imports are not installed.
+@pytest.fixture(scope='session')
+def thirstbot():
+    for module in ('colorama', 'fake_useragent', 'selenium', 'seleniumwire', 'webdriver_manager'):
+        pytest.importorskip(module)
+    return load_thirstbot()
+
+
+# Local server answering every GET with MEDIA_SIZE bytes
+@pytest.fixture(scope='session')
+def media_server(tmp_path_factory):
+    server, base_url = serve_directory(str(tmp_path_factory.mktemp('media')), synthetic_media_handler(MEDIA_SIZE))
+    yield base_url
+    server.shutdown()
+
+
+# Runs scrape() on FakeProfiles through ReplayTransport, inside a temporary working directory.
+# Each call writes the profile's current fixtures first, so posts published in between are picked up.
+class Replay:
+    def __init__(self, thirstbot, directory, media_origin):
+        self.thirstbot = thirstbot
+        self.directory = directory
+        self.media_origin = media_origin
+        self.store = StateStore(os.path.join(directory, STATE_NAME))
+        self.transport = None
+
+    def scrape(self, profile, force=False, link=False):
+        fixtures = os.path.join(self.directory, 'fixtures')
+        os.makedirs(fixtures, exist_ok=True)
+        write_profile_fixtures(self.thirstbot, profile, fixtures)
+        self.transport = CountingTransport(fixtures, self.media_origin)
+        with redirect_stdout(io.StringIO()):
+            self.thirstbot.scrape(None, GraphQLPager(self.transport, PAGE_SIZE, Pacer(0)), profile.name, self.store,
+                                  force, link=link)
+        return self.store.get_subject(profile.name)
+
+    # Every saved media file of a profile, relative to its folder, mapped to its inode
+    def files(self, profile):
+        root = os.path.join(self.directory, profile.name)
+        return {os.path.relpath(os.path.join(folder, name), root): os.stat(os.path.join(folder, name)).st_ino
+                for folder, _, names in os.walk(root) for name in names if name.endswith(('.png', '.mp4'))}
+
+    # Forgets the profile the way --delete does
+    def delete(self, profile):
+        self.store.delete_subject(profile.name)
+
+    # Forgets everything the way --reset does: state.db goes, the profile folders and their manifests stay
+    def reset(self):
+        self.store.close()
+        for name in (STATE_NAME, STATE_NAME + "-wal", STATE_NAME + "-shm"):
+            if os.path.exists(os.path.join(self.directory, name)):
+                os.remove(os.path.join(self.directory, name))
+        self.store = StateStore(os.path.join(self.directory, STATE_NAME))
+
+
+@pytest.fixture
+def replay(thirstbot, media_server, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(thirstbot, 'RESOLVE_INTERVAL', 0)
+    replay = Replay(thirstbot, str(tmp_path), media_server)
+    yield replay
+    replay.store.close()
+
+
+@pytest.fixture
+def profile():
+    return FakeProfile('replayed', 6, 2, media_base_url=FAKE_CDN)
@@ -0,0 +1,106 @@
+import copy
+import io
+import json
+import os
+from contextlib import redirect_stdout
+
+import pytest
+
+from bench.fake_graphql import FakeProfile
+from bench.replay import FAKE_CDN, write_profile_fixtures
+from pager import PAGE_SIZE, GraphQLPager, Pacer, Response
+from replay import ReplayTransport, fixture_name
+from state import StateStore
+
+# Timings of the scraping code on synthetic profiles replayed offline. Needs pytest-benchmark;
+# compare runs with e.g. `pytest tests/test_benchmarks.py --benchmark-autosave --benchmark-compare`.
+pytest.importorskip('pytest_benchmark')
+
+SIZES = [10, 1000, 50000]
+# A full scrape of the largest profile downloads 60k files, too many for a routine run
+DOWNLOAD_SIZES = [10, 1000]
+
+
+# Fixtures of a synthetic profile with `posts` timeline posts and a tenth as many IGTV videos, written once per size
+@pytest.fixture(scope='module', params=SIZES, ids=lambda posts: f"{posts} posts")
+def recorded(request, thirstbot, tmp_path_factory):
+    profile = FakeProfile(f"bench{request.param}", request.param, max(1, request.param // 10),
+                          media_base_url=FAKE_CDN)
+    directory = str(tmp_path_factory.mktemp('fixtures'))
+    return profile, directory, write_profile_fixtures(thirstbot, profile, directory)
+
+
+def user_of(thirstbot, profile, pager):
+    return thirstbot.get_meta_data(thirstbot.make_initial_request(pager, profile.name))[5]
+
+
+def test_parse(benchmark, thirstbot, recorded):
+    profile, directory, urls = recorded
+
+    def read(url):
+        with open(os.path.join(directory, fixture_name(url)), 'rb') as file:
+            return file.read()
+
+    metadata = read(urls['profile'])
+    pages = [(read(url), 'edge_owner_to_timeline_media', thirstbot.get_timeline_links) for url in urls['timeline']]
+    pages += [(read(url), 'edge_felix_video_timeline', thirstbot.get_igtv_links) for url in urls['igtv']]
+
+    def parse():
+        found = []
+        user = thirstbot.get_meta_data(Response(200, {}, metadata))[5]
+        thirstbot.drain(thirstbot.get_timeline_links(user['edge_owner_to_timeline_media']['edges'], 0), found.append)
+        thirstbot.drain(thirstbot.get_igtv_links(user['edge_felix_video_timeline']['edges'], 0), found.append)
+        for body, edge, links in pages:
+            thirstbot.drain(links(json.loads(body)['data']['user'][edge]['edges'], 0), found.append)
+        return found
+
+    assert len({media.media_id for media in benchmark(parse)}) > len(profile.timeline)
+
+
+def test_pagination(benchmark, thirstbot, recorded):
+    profile, directory, _ = recorded
+    pager = GraphQLPager(ReplayTransport(directory), PAGE_SIZE, Pacer(0))
+    user = user_of(thirstbot, profile, pager)
+
+    def paginate():
+        found = []
+        with redirect_stdout(io.StringIO()):
+            thirstbot.drain(thirstbot.scrape_timeline(pager, user, 0), found.append)
+        return found
+
+    assert len({media.shortcode for media in benchmark(paginate)}) == len(profile.timeline)
+
+
+# The copy of the first page scrape_timeline() and scrape_igtv() each start with
+def test_deepcopy(benchmark, thirstbot, recorded):
+    profile, directory, _ = recorded
+    user = user_of(thirstbot, profile, GraphQLPager(ReplayTransport(directory), PAGE_SIZE, Pacer(0)))
+
+    assert benchmark(copy.deepcopy, user) == user
+
+
+# A whole scrape(), downloading every file from the local media server into a fresh folder each round
+@pytest.mark.parametrize('posts', DOWNLOAD_SIZES, ids=lambda posts: f"{posts} posts")
+def test_download(benchmark, thirstbot, media_server, tmp_path, monkeypatch, posts):
+    profile = FakeProfile(f"bench{posts}", posts, max(1, posts // 10), media_base_url=FAKE_CDN)
+    fixtures = str(tmp_path / 'fixtures')
+    os.mkdir(fixtures)
+    write_profile_fixtures(thirstbot, profile, fixtures)
+    monkeypatch.setattr(thirstbot, 'RESOLVE_INTERVAL', 0)
+    rounds = []
+
+    def setup():
+        work = tmp_path / f"round{len(rounds)}"
+        work.mkdir()
+        os.chdir(work)
+        rounds.append(StateStore(str(work / 'state.db')))
+        return (None, GraphQLPager(ReplayTransport(fixtures, media_server), PAGE_SIZE, Pacer(0)), profile.name,
+                rounds[-1]), {}
+
+    monkeypatch.chdir(tmp_path)
+    with redirect_stdout(io.StringIO()):
+        benchmark.pedantic(thirstbot.scrape, setup=setup, rounds=3)
+
+    for store in rounds:
+        assert store.connection.execute("SELECT COUNT(*) FROM posts").fetchone()[0] > posts
+        store.close()
@@ -0,0 +1,190 @@
+import json
+import os
+import time
+import urllib.parse
+
+import pytest
+
+from bench.fixture_server import QuietHandler, serve_directory
+from downloader import Media, MediaStream, content_range, fetch_to_file
+from http_pool import ConnectionPool
+from manifest import Manifest
+
+CONTENT = os.urandom(100000)
+
+
+# Answers Range requests with 206 but always from the first byte, like a cache that mangles ranges
+class WrongRangeHandler(QuietHandler):
+    def send_head(self):
+        if 'Range' not in self.headers:
+            return super().send_head()
+        path = self.translate_path(self.path)
+        size = os.path.getsize(path)
+        self.send_response(206)
+        self.send_header('Content-Range', f"bytes 0-{size - 1}/{size}")
+        self.send_header('Content-Length', str(size))
+        self.end_headers()
+        return open(path, 'rb')
+
+
+# Sends half of stalled.bin and then stops, so the client times out part way through the body
+class StallingHandler(QuietHandler):
+    def do_GET(self):
+        if self.path != '/stalled.bin':
+            return super().do_GET()
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(CONTENT)))
+        self.end_headers()
+        self.wfile.write(CONTENT[:len(CONTENT) // 2])
+        self.wfile.flush()
+        time.sleep(2)
+
+
+def serve(directory, handler=QuietHandler):
+    with open(os.path.join(directory, 'media.bin'), 'wb') as file:
+        file.write(CONTENT)
+    return serve_directory(directory, handler)
+
+
+@pytest.fixture
+def media_url(tmp_path_factory):
+    server, base_url = serve(str(tmp_path_factory.mktemp('served')))
+    yield f"{base_url}/media.bin"
+    server.shutdown()
+
+
+# source: the URL the .part was downloaded from, when it isn't url itself
+def fetch(url, file_name, part=None, source=None):
+    if part is not None:
+        with open(file_name + ".part", 'wb') as file:
+            file.write(part)
+        with open(file_name + ".part.source", 'w') as file:
+            json.dump({'path': urllib.parse.urlsplit(source or url).path, 'validator': None}, file)
+    pool = ConnectionPool()
+    try:
+        return fetch_to_file(url, str(file_name), pool)
+    finally:
+        pool.close()
+
+
+# part:         what an earlier, interrupted attempt left behind
+# transferred:  bytes that then still have to be read from the server
+@pytest.mark.parametrize('part, transferred', [(None, len(CONTENT)), (CONTENT[:1000], len(CONTENT) - 1000),
+                                               (CONTENT, 0), (CONTENT + b'stale', len(CONTENT))],
+                         ids=['fresh', 'resumed', 'complete', 'longer than the file'])
+def test_fetch_to_file_ends_with_the_whole_file(media_url, tmp_path, part, transferred):
+    file_name = str(tmp_path / 'saved')
+
+    size, _, read = fetch(media_url, file_name, part)
+
+    assert (size, read) == (len(CONTENT), transferred)
+    with open(file_name, 'rb') as file:
+        assert file.read() == CONTENT
+    assert os.listdir(tmp_path) == ['saved']
+
+
+def test_fetch_to_file_restarts_when_the_range_is_not_the_one_asked_for(tmp_path):
+    server, base_url = serve(str(tmp_path), WrongRangeHandler)
+    file_name = str(tmp_path / 'saved')
+    try:
+        fetch(f"{base_url}/media.bin", file_name, CONTENT[:1000])
+    finally:
+        server.shutdown()
+
+    with open(file_name, 'rb') as file:
+        assert file.read() == CONTENT
+
+
+def test_fetch_to_file_restarts_a_part_from_another_url(tmp_path):
+    server, base_url = serve(str(tmp_path))
+    file_name = str(tmp_path / 'saved')
+    try:
+        fetch(f"{base_url}/media.bin", file_name, os.urandom(1000), f"{base_url}/other_rendition.bin")
+    finally:
+        server.shutdown()
+
+    with open(file_name, 'rb') as file:
+        assert file.read() == CONTENT
+
+
+def test_connection_is_usable_after_a_body_times_out(tmp_path):
+    server, base_url = serve(str(tmp_path), StallingHandler)
+    pool = ConnectionPool(timeout=0.3)
+    try:
+        with pytest.raises(TimeoutError):
+            fetch_to_file(f"{base_url}/stalled.bin", str(tmp_path / 'stalled'), pool)
+        size, _, _ = fetch_to_file(f"{base_url}/media.bin", str(tmp_path / 'saved'), pool)
+    finally:
+        pool.close()
+        server.shutdown()
+
+    assert size == len(CONTENT)
+
+
+def test_content_range():
+    assert content_range('bytes 100-199/200') == (100, 200)
+    assert content_range('bytes */200') == (None, 200)
+    assert content_range('bytes 0-99/*') == (0, None)
+    assert content_range(None) == (None, None)
+
+
+def stream_to(directory, manifest=None, **options):
+    targets = {
+        'image': (os.path.join(directory, 'pictures'), 'profile', '.png'),
+        'video': (os.path.join(directory, 'videos'), 'profile', '.mp4')
+    }
+    return MediaStream(targets, 2, manifest, quiet=True, **options)
+
+
+def media(kind, number, url):
+    return Media(kind, f"{url}?v={number}", f"S{number}", 1600000000 - number, f"{kind}{number}")
+
+
+def test_stream_counts_down_from_the_newest(media_url, tmp_path):
+    stream = stream_to(str(tmp_path))
+    for number in range(3):
+        stream.put(media('image', number, media_url))
+    stream.put(media('video', 0, media_url))
+    stream.close()
+
+    saved = stream.finish({'image': 3, 'video': 1})
+
+    assert [(item.media_id, os.path.basename(name)) for item, name in saved] == [
+        ('image0', 'profile_3.png'), ('image1', 'profile_2.png'), ('image2', 'profile_1.png'),
+        ('video0', 'profile_1.mp4')]
+    assert sorted(os.listdir(tmp_path / 'pictures')) == ['profile_1.png', 'profile_2.png', 'profile_3.png']
+
+
+def test_stream_skips_media_on_disk_and_numbers_above_it(media_url, tmp_path):
+    manifest = Manifest(str(tmp_path / 'manifest.jsonl'))
+    first = stream_to(str(tmp_path), manifest)
+    first.put(media('image', 0, media_url))
+    first.close()
+    first.finish({'image': 1, 'video': 0})
+
+    second = stream_to(str(tmp_path), Manifest(str(tmp_path / 'manifest.jsonl')))
+    assert second.is_saved(media('image', 0, None))
+    second.put(media('image', 0, media_url))
+    second.put(media('image', 1, media_url))
+    second.close()
+
+    assert second.skipped == 1
+    assert [os.path.basename(path) for _, path in second.existing] == ['profile_1.png']
+    assert second.last_number('image') == 1
+    assert [os.path.basename(name) for _, name in second.finish({'image': 2, 'video': 0})] == ['profile_2.png']
+
+
+def test_finish_refuses_to_replace_a_saved_file(media_url, tmp_path):
+    stream = stream_to(str(tmp_path))
+    stream.put(media('image', 0, media_url))
+    stream.put(media('image', 1, media_url))
+    stream.close()
+    with open(tmp_path / 'pictures' / 'profile_1.png', 'wb') as file:
+        file.write(b'archived')
+
+    with pytest.raises(FileExistsError):
+        stream.finish({'image': 2, 'video': 0})
+
+    with open(tmp_path / 'pictures' / 'profile_1.png', 'rb') as file:
+        assert file.read() == b'archived'
+    assert not os.path.exists(tmp_path / 'pictures' / 'profile_2.png')
@@ -0,0 +1,46 @@
+import threading
+
+import pytest
+
+from bench.fixture_server import make_fixtures, serve_directory
+from downloader import Media, MediaStream
+from http_pool import ConnectionPool
+
+
+@pytest.fixture
+def fixture_urls(tmp_path_factory):
+    directory = str(tmp_path_factory.mktemp('served'))
+    server, base_url = serve_directory(directory)
+    yield [f"{base_url}/{name}" for name in make_fixtures(directory, 8, 1000)]
+    server.shutdown()
+
+
+def get(pool, url):
+    response = pool.request('GET', url)
+    response.read()
+    return response.status
+
+
+def test_streams_close_their_connections(fixture_urls, tmp_path):
+    pool = ConnectionPool()
+    for run in range(5):
+        stream = MediaStream({'file': (str(tmp_path / str(run)), 'bench', '.bin')}, 4, pool=pool, quiet=True)
+        for number, url in enumerate(fixture_urls):
+            stream.put(Media('file', url, None, 0, str(number)))
+        stream.close()
+
+    assert pool._owners == {}
+
+
+def test_connections_of_finished_threads_are_closed(fixture_urls):
+    pool = ConnectionPool()
+    threads = [threading.Thread(target=get, args=(pool, url)) for url in fixture_urls[:4]]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert get(pool, fixture_urls[0]) == 200
+
+    assert list(pool._owners.values()) == [threading.current_thread()]
+    pool.close()
@@ -0,0 +1,81 @@
+import os
+
+from manifest import Manifest
+
+
+def write(path, content=b'media'):
+    with open(path, 'wb') as file:
+        file.write(content)
+    return str(path)
+
+
+def lines(path):
+    with open(path) as file:
+        return file.readlines()
+
+
+def test_entries_survive_a_reload(tmp_path):
+    saved = write(tmp_path / 'a.png')
+    Manifest(str(tmp_path / 'manifest.jsonl')).add('a', saved, 5, 'sum-a')
+
+    manifest = Manifest(str(tmp_path / 'manifest.jsonl'))
+
+    assert manifest.present('a') == saved
+    assert manifest.is_complete('a', saved)
+    assert not manifest.is_complete('a', str(tmp_path / 'elsewhere.png'))
+
+
+def test_a_file_that_changed_size_is_not_present(tmp_path):
+    manifest = Manifest(str(tmp_path / 'manifest.jsonl'))
+    saved = write(tmp_path / 'a.png')
+    manifest.add('a', saved, 5, 'sum-a')
+
+    write(saved, b'truncated by hand')
+
+    assert manifest.present('a') is None
+
+
+def test_a_line_cut_short_by_a_crash_is_ignored(tmp_path):
+    manifest = Manifest(str(tmp_path / 'manifest.jsonl'))
+    manifest.add('a', write(tmp_path / 'a.png'), 5, 'sum-a')
+    with open(tmp_path / 'manifest.jsonl', 'a') as file:
+        file.write('{"key": "b", "pa')
+
+    assert list(Manifest(str(tmp_path / 'manifest.jsonl')).entries) == ['a']
+
+
+def test_add_reports_identical_content_already_on_disk(tmp_path):
+    manifest = Manifest(str(tmp_path / 'manifest.jsonl'))
+    first = write(tmp_path / 'a.png')
+    manifest.add('a', first, 5, 'same')
+
+    assert manifest.add('b', write(tmp_path / 'b.png'), 5, 'same') == first
+    assert manifest.add('c', write(tmp_path / 'c.png'), 5, 'different') is None
+
+
+def test_move_writes_every_rename_at_once(tmp_path):
+    manifest = Manifest(str(tmp_path / 'manifest.jsonl'))
+    for key in 'abc':
+        manifest.add(key, write(tmp_path / f".{key}"), 5, f"sum-{key}")
+    for key in 'abc':
+        os.replace(tmp_path / f".{key}", tmp_path / f"{key}.png")
+
+    manifest.move((key, str(tmp_path / f"{key}.png")) for key in 'abc')
+
+    assert len(lines(tmp_path / 'manifest.jsonl')) == 6
+    reloaded = Manifest(str(tmp_path / 'manifest.jsonl'))
+    assert [reloaded.present(key) for key in 'abc'] == [str(tmp_path / f"{key}.png") for key in 'abc']
+    # the renamed file is the one later duplicates are pointed at
+    assert reloaded.add('d', write(tmp_path / 'd.png'), 5, 'sum-a') == str(tmp_path / 'a.png')
+
+
+def test_superseded_lines_are_compacted_on_load(tmp_path):
+    manifest = Manifest(str(tmp_path / 'manifest.jsonl'))
+    saved = write(tmp_path / 'a.png')
+    for _ in range(3):
+        manifest.add('a', saved, 5, 'sum-a')
+
+    reloaded = Manifest(str(tmp_path / 'manifest.jsonl'))
+
+    assert len(lines(tmp_path / 'manifest.jsonl')) == 1
+    assert reloaded.present('a') == saved
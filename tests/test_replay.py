@@ -0,0 +1,47 @@
+from pager import Response, build_request
+from replay import RecordingTransport, ReplayTransport, fixture_name
+
+TIMELINE_HASH = '32b14723a678bd4628d70c1f877b94c9'
+
+
+class FixedTransport:
+    def __init__(self, responses):
+        self.responses = responses
+
+    def get(self, url):
+        return self.responses.get(url, Response(404, {}, b''))
+
+
+def test_fixture_names_follow_the_query_not_its_encoding():
+    page = build_request('4242', '12', TIMELINE_HASH)
+
+    assert fixture_name(page) == fixture_name(build_request('4242', '12', TIMELINE_HASH))
+    assert fixture_name(page) != fixture_name(build_request('4242', '42', TIMELINE_HASH))
+    assert fixture_name(page) != fixture_name(build_request('4242', '12', TIMELINE_HASH, page_size=50))
+    assert fixture_name("https://www.instagram.com/someone/?__a=1").startswith('someone_')
+
+
+def test_recorded_responses_replay_offline(tmp_path):
+    profile = "https://www.instagram.com/someone/?__a=1"
+    missing = "https://www.instagram.com/tv/gone/?__a=1"
+    recorder = RecordingTransport(FixedTransport({profile: Response(200, {}, b'{"graphql": {}}')}), str(tmp_path))
+    recorder.get(profile)
+    recorder.get(missing)
+
+    replay = ReplayTransport(str(tmp_path))
+
+    assert replay.get(profile).status == 200
+    assert replay.get(profile).body == b'{"graphql": {}}'
+    assert replay.get(missing).status == 404
+
+
+def test_cdn_urls_are_pointed_at_the_media_origin(tmp_path):
+    url = "https://www.instagram.com/someone/?__a=1"
+    body = (b'{"a": "https://scontent-lhr8-1.cdninstagram.com/v/1.jpg?oe=5F",'
+            b' "b": "https:\\/\\/instagram.fxyz1-1.fna.fbcdn.net\\/v\\/2.mp4"}')
+    RecordingTransport(FixedTransport({url: Response(200, {}, body)}), str(tmp_path)).get(url)
+
+    replayed = ReplayTransport(str(tmp_path), "http://127.0.0.1:8000").get(url).body
+
+    assert replayed == (b'{"a": "http://127.0.0.1:8000/v/1.jpg?oe=5F",'
+                        b' "b": "http://127.0.0.1:8000\\/v\\/2.mp4"}')
@@ -0,0 +1,27 @@
+import threading
+
+from resolver import ShortcodeCache, ShortcodeResolver
+
+
+# Answers every post lookup with a video URL named after the shortcode, noting which thread asked
+class RecordingPager:
+    def __init__(self):
+        self.threads = set()
+
+    def get_json(self, url):
+        self.threads.add(threading.get_ident())
+        shortcode = url.split('/')[-2]
+        return {'graphql': {'shortcode_media': {'video_url': f"https://cdn.example/{shortcode}.mp4"}}}
+
+
+def test_batches_share_the_resolver_threads(tmp_path):
+    pager = RecordingPager()
+    resolver = ShortcodeResolver(pager, ShortcodeCache(str(tmp_path / 'shortcodes.jsonl')), workers=2)
+    try:
+        for page in range(5):
+            pairs = [(f"P{page}x{number}", None) for number in range(4)]
+            assert resolver.resolve_many(pairs) == [f"https://cdn.example/{shortcode}.mp4" for shortcode, _ in pairs]
+    finally:
+        resolver.close()
+
+    assert len(pager.threads) <= 2
@@ -0,0 +1,169 @@
+import json
+import os
+
+import pytest
+
+from pager import PAGE_SIZE, GraphQLPager, Pacer, PagerError
+from replay import ReplayTransport
+from state import STATE_NAME, StateStore
+
+# A 6-post FakeProfile holds 4 images, 4 videos (2 of each in sidecars) and 2 IGTV videos
+EXPECTED = {'image-count': 4, 'video-count': 4, 'igtv-count': 2}
+
+
+def counts(subject):
+    return {key: subject[key] for key in EXPECTED}
+
+
+def test_first_scrape_numbers_files_down_from_the_newest(replay, profile):
+    subject = replay.scrape(profile)
+
+    assert counts(subject) == EXPECTED
+    assert sorted(replay.files(profile)) == sorted(
+        [os.path.join('igtv', f"replayed_igtv_{n}.mp4") for n in (1, 2)] +
+        [os.path.join('timeline', 'pictures', f"replayed_{n}.png") for n in (1, 2, 3, 4)] +
+        [os.path.join('timeline', 'videos', f"replayed_{n}.mp4") for n in (1, 2, 3, 4)])
+    rows = replay.store.connection.execute("SELECT COUNT(*) FROM posts WHERE profile = ?", (profile.name,))
+    assert rows.fetchone()[0] == 10
+
+
+def test_new_posts_are_numbered_above_the_old_ones(replay, profile):
+    replay.scrape(profile)
+    before = replay.files(profile)
+    profile.publish(3, 1)
+
+    subject = replay.scrape(profile)
+
+    assert counts(subject) == {'image-count': 6, 'video-count': 6, 'igtv-count': 3}
+    after = replay.files(profile)
+    assert {name: after[name] for name in before} == before
+    assert os.path.join('timeline', 'pictures', 'replayed_6.png') in after
+
+
+# --delete and --reset forget the stored counts but leave the files, and the manifest, on disk
+@pytest.mark.parametrize('forget', ['delete', 'reset'])
+def test_forgotten_profile_is_never_numbered_over(replay, profile, forget):
+    replay.scrape(profile)
+    before = replay.files(profile)
+
+    replay.delete(profile) if forget == 'delete' else replay.reset()
+    subject = replay.scrape(profile)
+    assert counts(subject) == EXPECTED
+    assert replay.files(profile) == before
+
+    replay.delete(profile) if forget == 'delete' else replay.reset()
+    profile.publish(3, 1)
+    subject = replay.scrape(profile)
+    assert counts(subject) == {'image-count': 6, 'video-count': 6, 'igtv-count': 3}
+    after = replay.files(profile)
+    assert {name: after[name] for name in before} == before
+
+
+def test_crash_before_the_state_commit_is_recovered(replay, profile):
+    def crash():
+        raise KeyboardInterrupt
+
+    replay.store.transaction = crash
+    with pytest.raises(KeyboardInterrupt):
+        replay.scrape(profile)
+    del replay.store.transaction
+    before = replay.files(profile)
+    assert len(before) == 10 and replay.store.get_subject(profile.name) is None
+
+    subject = replay.scrape(profile)
+
+    assert counts(subject) == EXPECTED
+    assert replay.files(profile) == before
+    rows = replay.store.connection.execute("SELECT COUNT(*) FROM posts WHERE profile = ?", (profile.name,))
+    assert rows.fetchone()[0] == 10
+
+
+def test_missing_profile_reports_the_failed_request(replay):
+    pager = GraphQLPager(ReplayTransport(replay.directory), PAGE_SIZE, Pacer(0))
+
+    with pytest.raises(PagerError) as failure:
+        replay.thirstbot.scrape(None, pager, 'nobody', replay.store)
+
+    assert failure.value.status == 404
+    assert replay.store.get_subject('nobody') is None
+
+
+def test_forced_rescan_only_fetches_metadata(replay, profile):
+    profile.publish(0, 40)
+    replay.scrape(profile)
+    before = replay.files(profile)
+    # an expired cache is the same as no cache
+    os.remove(os.path.join(replay.directory, profile.name, 'shortcodes.jsonl'))
+
+    replay.scrape(profile, force=True)
+
+    assert replay.files(profile) == before
+    assert [url for url in replay.transport.urls if '/tv/' in url] == []
+
+
+def test_link_hard_links_identical_media(replay, profile):
+    replay.scrape(profile, link=True)
+
+    # the media server answers every URL with the same bytes
+    assert len(set(replay.files(profile).values())) == 1
+
+
+def test_without_link_identical_media_is_copied(replay, profile):
+    replay.scrape(profile)
+
+    assert len(set(replay.files(profile).values())) == 10
+
+
+# An IGTV video also shared to the feed has the same media ID in both, and is saved in both folders
+@pytest.mark.parametrize('link', [True, False], ids=['link', 'copy'])
+def test_igtv_shared_to_the_feed_is_saved_as_igtv_too(replay, profile, link):
+    profile.igtv[0]['id'] = profile.timeline[1]['id']
+
+    subject = replay.scrape(profile, link=link)
+    files = replay.files(profile)
+    replay.scrape(profile, force=True, link=link)
+
+    assert counts(subject) == EXPECTED
+    assert len(files) == 10
+    igtv, video = os.path.join('igtv', 'replayed_igtv_2.mp4'), os.path.join('timeline', 'videos', 'replayed_4.mp4')
+    assert (files[igtv] == files[video]) == link
+    assert replay.files(profile) == files
+    rows = replay.store.connection.execute("SELECT COUNT(*) FROM posts WHERE profile = ?", (profile.name,))
+    assert rows.fetchone()[0] == 10
+
+
+def test_subjects_move_from_user_json_to_the_state_store(thirstbot, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    subjects = [
+        {'name': 'kept', 'index': 0, 'date-last': 1600000000, 'igtv-last': 0, 'image-count': 7, 'video-count': 2,
+         'igtv-count': 0, 'timeline-size': 9, 'igtv-size': 0},
+        {'name': 'dropped', 'index': 1, 'date-last': 1500000000, 'igtv-last': 1500000000, 'image-count': 1,
+         'video-count': 1, 'igtv-count': 1, 'timeline-size': 2, 'igtv-size': 1}
+    ]
+    with open('user.json', 'w') as file:
+        json.dump({'email': 'me', 'pass': 'secret', 'subjects': subjects}, file)
+
+    assert thirstbot.main(['--delete', 'dropped']) == 0
+
+    with open('user.json') as file:
+        assert json.load(file) == {'email': 'me', 'pass': 'secret'}
+    store = StateStore(str(tmp_path / STATE_NAME))
+    assert store.names() == ['kept']
+    assert store.get_subject('kept') == {key: value for key, value in subjects[0].items() if key != 'index'}
+    store.close()
+
+
+def test_delete_does_not_ask_for_a_login(thirstbot, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr('builtins.input', lambda prompt='': pytest.fail(f"asked {prompt!r}"))
+    store = StateStore(str(tmp_path / STATE_NAME))
+    store.put_subject({'name': 'dropped', 'date-last': 1500000000, 'igtv-last': 0, 'image-count': 1,
+                       'video-count': 0, 'igtv-count': 0, 'timeline-size': 1, 'igtv-size': 0})
+    store.close()
+
+    assert thirstbot.main(['--delete', 'dropped']) == 0
+
+    assert not os.path.exists('user.json')
+    store = StateStore(str(tmp_path / STATE_NAME))
+    assert store.names() == []
+    store.close()